@@ -3,62 +3,188 @@ AWS Deployment Script for Weather Agent
 This script helps deploy the LiveKit agent to AWS ECS Fargate
 """
 
-import boto3
+import asyncio
+import contextlib
+import aioboto3
+import botocore.serialize
+from aiobotocore.config import AioConfig
 import json
+import orjson
 import base64
 import os
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+LOG_GROUP_NAME = "/ecs/weather-agent"
+
+class _OrjsonCodec:
+    """Stand-in for the json module inside botocore.serialize that encodes with orjson"""
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(json, name)
+    
+    @staticmethod
+    def dumps(obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=kwargs.get('default')).decode()
+
+def use_orjson_serializer() -> None:
+    """Encode JSON-protocol request bodies (ECS, ECR, Logs) with orjson instead of stdlib json"""
+    botocore.serialize.json = _OrjsonCodec()
+
+class RequestBatcher:
+    """Coalesce single-key lookups into one bulk AWS call.
+    
+    A lookup made while no bulk call is running is sent right away. Lookups that arrive while one is
+    running are queued and flushed when it finishes, or after max_items keys or max_wait seconds.
+    fetch_many may map a key to an exception, which is raised to that key's callers only.
+    """
+    
+    def __init__(self,
+                 fetch_many: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+                 max_items: int = 50,
+                 max_wait: float = 0.1):
+        self._fetch_many = fetch_many
+        self._max_items = max_items
+        self._max_wait = max_wait
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+    
+    async def submit(self, key: Hashable) -> Any:
+        """Queue a lookup for key and wait for its result from the next bulk call"""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.setdefault(key, []).append(fut)
+        if not self._tasks or len(self._pending) >= self._max_items:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_wait, self._flush)
+        return await fut
+    
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_batch_done)
+    
+    def _on_batch_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if self._pending and not self._tasks:
+            self._flush()
+    
+    async def _run(self, batch: Dict[Hashable, List[asyncio.Future]]) -> None:
+        try:
+            results = await self._fetch_many(list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for fut in futures:
+                    if not fut.done():
+                        fut.set_exception(e)
+            return
+        for key, futures in batch.items():
+            for fut in futures:
+                if fut.done():
+                    continue
+                result = results.get(key, KeyError(key))
+                if isinstance(result, BaseException):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
 class AWSDeployer:
     def __init__(self, region: str = "us-west-2"):
         self.region = region
-        self.ecs_client = boto3.client('ecs', region_name=region)
-        self.ecr_client = boto3.client('ecr', region_name=region)
-        self.logs_client = boto3.client('logs', region_name=region)
+        # One session shares credential resolution; the config pools and keeps connections alive
+        self._session = aioboto3.Session(region_name=region)
+        self._config = AioConfig(
+            max_pool_connections=50,
+            retries={'mode': 'adaptive', 'max_attempts': 5},
+            connector_args={'keepalive_timeout': 75},
+        )
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._account_id: str | None = None
+        self._task_def_template: Dict[str, Any] | None = None
+        self._log_group_ready = False
         
-    def create_ecr_repository(self, repo_name: str) -> str:
+    async def __aenter__(self) -> "AWSDeployer":
+        """Open the clients; they stay alive for the whole deploy"""
+        enter = self._exit_stack.enter_async_context
+        try:
+            self.ecs_client = await enter(self._session.client('ecs', config=self._config))
+            self.ecr_client = await enter(self._session.client('ecr', config=self._config))
+            self.logs_client = await enter(self._session.client('logs', config=self._config))
+            self._sts_client = await enter(self._session.client('sts', config=self._config))
+        except BaseException:
+            # Close whichever clients were already opened
+            await self._exit_stack.aclose()
+            raise
+        # DescribeRepositories accepts up to 100 names per call
+        self._repository_batcher = RequestBatcher(self._describe_repositories)
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self._exit_stack.aclose()
+    
+    async def create_ecr_repository(self, repo_name: str) -> str:
         """Create ECR repository for the agent image"""
         try:
-            response = self.ecr_client.create_repository(
+            response = await self.ecr_client.create_repository(
                 repositoryName=repo_name,
                 imageScanningConfiguration={'scanOnPush': True}
             )
             return response['repository']['repositoryUri']
         except self.ecr_client.exceptions.RepositoryAlreadyExistsException:
-            response = self.ecr_client.describe_repositories(repositoryNames=[repo_name])
-            return response['repositories'][0]['repositoryUri']
+            repository = await self._repository_batcher.submit(repo_name)
+            return repository['repositoryUri']
     
-    def create_task_definition(self, 
-                             image_uri: str, 
-                             env_vars: Dict[str, str]) -> str:
-        """Create ECS task definition"""
-        
-        # Create CloudWatch log group
-        log_group_name = "/ecs/weather-agent"
+    async def _describe_repositories(self, repo_names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Describe several ECR repositories in a single call"""
+        try:
+            response = await self.ecr_client.describe_repositories(repositoryNames=repo_names)
+        except self.ecr_client.exceptions.RepositoryNotFoundException:
+            if len(repo_names) == 1:
+                raise
+            # One missing name fails the whole call; look the names up individually instead
+            results = await asyncio.gather(
+                *(self._describe_repositories([name]) for name in repo_names),
+                return_exceptions=True,
+            )
+            return {
+                name: result if isinstance(result, BaseException) else result[name]
+                for name, result in zip(repo_names, results)
+            }
+        return {repo['repositoryName']: repo for repo in response['repositories']}
+    
+    async def ensure_log_group(self) -> str:
+        """Create the task definition's CloudWatch log group if it doesn't exist"""
         try:
-            self.logs_client.create_log_group(logGroupName=log_group_name)
+            await self.logs_client.create_log_group(logGroupName=LOG_GROUP_NAME)
         except self.logs_client.exceptions.ResourceAlreadyExistsException:
             pass
-        
-        environment = [{"name": k, "value": v} for k, v in env_vars.items()]
-        
-        task_definition = {
+        self._log_group_ready = True
+        return LOG_GROUP_NAME
+    
+    def _build_task_def_template(self, account_id: str) -> Dict[str, Any]:
+        """Build the static parts of the task definition once per deployer"""
+        return {
             "family": "weather-agent",
             "networkMode": "awsvpc",
             "requiresCompatibilities": ["FARGATE"],
             "cpu": "256",
             "memory": "512",
-            "executionRoleArn": f"arn:aws:iam::{self.get_account_id()}:role/ecsTaskExecutionRole",
+            "executionRoleArn": f"arn:aws:iam::{account_id}:role/ecsTaskExecutionRole",
             "containerDefinitions": [
                 {
                     "name": "weather-agent",
-                    "image": image_uri,
+                    "image": None,
                     "essential": True,
-                    "environment": environment,
+                    "environment": [],
                     "portMappings": [
                         {
                             "containerPort": 8080,
@@ -68,7 +194,7 @@ class AWSDeployer:
                     "logConfiguration": {
                         "logDriver": "awslogs",
                         "options": {
-                            "awslogs-group": log_group_name,
+                            "awslogs-group": LOG_GROUP_NAME,
                             "awslogs-region": self.region,
                             "awslogs-stream-prefix": "ecs"
                         }
@@ -76,11 +202,30 @@ class AWSDeployer:
                 }
             ]
         }
+    
+    async def create_task_definition(self, 
+                             image_uri: str, 
+                             env_vars: Dict[str, str]) -> str:
+        """Create ECS task definition"""
+        
+        if not self._log_group_ready:
+            await self.ensure_log_group()
+        if self._task_def_template is None:
+            self._task_def_template = self._build_task_def_template(await self.get_account_id())
         
-        response = self.ecs_client.register_task_definition(**task_definition)
+        # Shallow-copy only the levels we patch; the rest of the template is shared.
+        # Unset variables (os.getenv(..., "") in deploy) are dropped rather than registered as empty strings.
+        container = {
+            **self._task_def_template["containerDefinitions"][0],
+            "image": image_uri,
+            "environment": [{"name": k, "value": v} for k, v in env_vars.items() if v],
+        }
+        task_definition = {**self._task_def_template, "containerDefinitions": [container]}
+        
+        response = await self.ecs_client.register_task_definition(**task_definition)
         return response['taskDefinition']['taskDefinitionArn']
     
-    def create_ecs_service(self, 
+    async def create_ecs_service(self, 
                           cluster_name: str,
                           task_definition_arn: str,
                           subnet_ids: list,
@@ -89,7 +234,7 @@ class AWSDeployer:
         
         # Create cluster if it doesn't exist
         try:
-            self.ecs_client.create_cluster(clusterName=cluster_name)
+            await self.ecs_client.create_cluster(clusterName=cluster_name)
         except self.ecs_client.exceptions.ClusterAlreadyExistsException:
             pass
         
@@ -108,68 +253,81 @@ class AWSDeployer:
             }
         }
         
-        response = self.ecs_client.create_service(**service_definition)
+        response = await self.ecs_client.create_service(**service_definition)
         return response['service']['serviceArn']
     
-    def get_account_id(self) -> str:
-        """Get AWS account ID"""
-        sts_client = boto3.client('sts')
-        return sts_client.get_caller_identity()['Account']
+    async def get_account_id(self) -> str:
+        """Get AWS account ID (cached after the first STS call)"""
+        if self._account_id is None:
+            identity = await self._sts_client.get_caller_identity()
+            self._account_id = identity['Account']
+        return self._account_id
 
-def main():
+async def bootstrap(deployer: AWSDeployer) -> str:
+    """Run the independent setup calls concurrently and return the ECR repository URI"""
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(deployer.get_account_id())
+        repo_task = tg.create_task(deployer.create_ecr_repository("weather-agent"))
+        tg.create_task(deployer.ensure_log_group())
+    return repo_task.result()
+
+async def deploy():
     """Main deployment function"""
-    deployer = AWSDeployer()
-    
-    # Environment variables for the agent
-    env_vars = {
-        "LIVEKIT_URL": os.getenv("LIVEKIT_URL", ""),
-        "LIVEKIT_API_KEY": os.getenv("LIVEKIT_API_KEY", ""),
-        "LIVEKIT_API_SECRET": os.getenv("LIVEKIT_API_SECRET", ""),
-        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", ""),
-        "DEEPGRAM_API_KEY": os.getenv("DEEPGRAM_API_KEY", ""),
-        "OPENWEATHER_API_KEY": os.getenv("OPENWEATHER_API_KEY", ""),
-    }
-    
-    print("🚀 Starting AWS deployment...")
-    
-    # Step 1: Create ECR repository
-    print("📦 Creating ECR repository...")
-    repo_uri = deployer.create_ecr_repository("weather-agent")
-    print(f"✅ ECR repository created: {repo_uri}")
-    
-    # Step 2: Build and push Docker image (manual step)
-    print(f"""
-    📋 Next steps (run these commands locally):
-    
-    1. Build and tag the Docker image:
-       docker build -t weather-agent .
-       docker tag weather-agent:latest {repo_uri}:latest
-    
-    2. Login to ECR and push:
-       aws ecr get-login-password --region {deployer.region} | docker login --username AWS --password-stdin {repo_uri}
-       docker push {repo_uri}:latest
-    
-    3. Update the image URI below and run the deployment again.
-    """)
-    
-    # For demo purposes, using a placeholder image URI
-    image_uri = f"{repo_uri}:latest"
-    
-    # Step 3: Create task definition
-    print("📝 Creating ECS task definition...")
-    task_def_arn = deployer.create_task_definition(image_uri, env_vars)
-    print(f"✅ Task definition created: {task_def_arn}")
-    
-    print("""
-    🎉 Deployment setup complete!
-    
-    To finish the deployment:
-    1. Push your Docker image to ECR (see commands above)
-    2. Configure your VPC subnets and security groups
-    3. Create the ECS service using the task definition
-    
-    Estimated monthly cost: ~$5-10 for Fargate + CloudWatch logs
-    """)
+    async with AWSDeployer() as deployer:
+        # Environment variables for the agent
+        env_vars = {
+            "LIVEKIT_URL": os.getenv("LIVEKIT_URL", ""),
+            "LIVEKIT_API_KEY": os.getenv("LIVEKIT_API_KEY", ""),
+            "LIVEKIT_API_SECRET": os.getenv("LIVEKIT_API_SECRET", ""),
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", ""),
+            "DEEPGRAM_API_KEY": os.getenv("DEEPGRAM_API_KEY", ""),
+            "OPENWEATHER_API_KEY": os.getenv("OPENWEATHER_API_KEY", ""),
+        }
+    
+        print("🚀 Starting AWS deployment...")
+    
+        # Step 1: Create ECR repository and log group, resolve account ID (in parallel)
+        print("📦 Creating ECR repository and CloudWatch log group...")
+        repo_uri = await bootstrap(deployer)
+        print(f"✅ ECR repository created: {repo_uri}")
+    
+        # Step 2: Build and push Docker image (manual step)
+        print(f"""
+        📋 Next steps (run these commands locally):
+    
+        1. Build and tag the Docker image:
+           docker build -t weather-agent .
+           docker tag weather-agent:latest {repo_uri}:latest
+    
+        2. Login to ECR and push:
+           aws ecr get-login-password --region {deployer.region} | docker login --username AWS --password-stdin {repo_uri}
+           docker push {repo_uri}:latest
+    
+        3. Update the image URI below and run the deployment again.
+        """)
+    
+        # For demo purposes, using a placeholder image URI
+        image_uri = f"{repo_uri}:latest"
+    
+        # Step 3: Create task definition
+        print("📝 Creating ECS task definition...")
+        task_def_arn = await deployer.create_task_definition(image_uri, env_vars)
+        print(f"✅ Task definition created: {task_def_arn}")
+    
+        print("""
+        🎉 Deployment setup complete!
+    
+        To finish the deployment:
+        1. Push your Docker image to ECR (see commands above)
+        2. Configure your VPC subnets and security groups
+        3. Create the ECS service using the task definition
+    
+        Estimated monthly cost: ~$5-10 for Fargate + CloudWatch logs
+        """)
+
+def main():
+    use_orjson_serializer()
+    asyncio.run(deploy())
 
 if __name__ == "__main__":
     main()
@@ -8,6 +8,8 @@ source venv/bin/activate
 
 # Install dependencies
 pip3 install -r requirements.txt
+# Dependencies for the AWS deployment script
+pip3 install -r requirements-deploy.txt
 
 # Copy environment file
 # if [ ! -f .env ]; then
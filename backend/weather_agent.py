@@ -1,9 +1,14 @@
 import asyncio
 import logging
 import os
+import sys
 import json
+import random
+import time
 import aiohttp
-from typing import Annotated
+import orjson
+import yarl
+from typing import Annotated, NamedTuple
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -11,54 +16,206 @@ load_dotenv()
 
 from livekit import agents, rtc
 from livekit.agents import AgentSession, Agent, JobContext, RoomInputOptions, RoomOutputOptions
-from livekit.plugins import openai, silero, deepgram
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_OWM_BASE = yarl.URL("https://api.openweathermap.org/data/2.5/weather")
+
+_WEATHER_TPL = (
+    "Here's the current weather in {city}, {state}:\n"
+    "\n"
+    "🌡️ Temperature: {temp}°F (feels like {feels_like}°F)\n"
+    "🌤️ Conditions: {desc}\n"
+    "💧 Humidity: {humidity}%\n"
+    "💨 Wind Speed: {wind} mph\n"
+    "\n"
+    "As someone who's lived in San Ramon for years, I can tell you this is pretty typical for our area!\n"
+    "We're blessed with great weather year-round here in the East Bay."
+)
+
+_FALLBACK_NO_KEY = "I'm sorry, I don't have access to live weather data right now, but San Ramon typically enjoys a Mediterranean climate with warm, dry summers and mild winters!"
+_FALLBACK_HTTP_ERR = "I'm having trouble accessing the weather data right now, but San Ramon usually has beautiful weather!"
+_FALLBACK_EXC = "I'm having trouble getting the latest weather data, but San Ramon typically has wonderful Mediterranean weather!"
+
+# Retry transient OpenWeather failures with full jitter; stop calling it for a while if it keeps failing
+_MAX_ATTEMPTS = 2
+_RETRY_BASE_DELAY = 0.1
+_RETRY_BUDGET = 1.0
+_BREAKER_THRESHOLD = 3
+_BREAKER_COOLDOWN = 30
+
+class _CacheEntry(NamedTuple):
+    fetched_at: float
+    report: str
+    etag: str | None
+    last_modified: str | None
+
 class WeatherAgentClass:
+    __slots__ = ('weather_api_key', '_session', '_session_lock', '_cache', '_cache_ttl', '_inflight',
+                 '_consec_failures', '_open_until', '_probing')
+
     def __init__(self):
         self.weather_api_key = os.getenv("OPENWEATHER_API_KEY")
         if not self.weather_api_key:
             logger.warning("OpenWeather API key not found. Weather functionality will be limited.")
+        # Shared HTTP session so repeat calls reuse the keepalive connection pool
+        self._session: aiohttp.ClientSession | None = None
+        self._session_lock = asyncio.Lock()
+        # Formatted reports keyed by (city, state); OpenWeather refreshes roughly every 10 minutes
+        # Validators are kept so stale entries can be revalidated with a conditional GET
+        self._cache: dict[tuple[str, str], _CacheEntry] = {}
+        self._cache_ttl = 300
+        # Concurrent callers for the same key await the first caller's fetch
+        self._inflight: dict[tuple[str, str], asyncio.Task[str]] = {}
+        # Circuit breaker state
+        self._consec_failures = 0
+        self._open_until = 0.0
+        self._probing = False
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            async with self._session_lock:
+                if self._session is None or self._session.closed:
+                    self._session = aiohttp.ClientSession(
+                        connector=aiohttp.TCPConnector(
+                            limit=100,
+                            limit_per_host=20,
+                            use_dns_cache=True,
+                            ttl_dns_cache=600,
+                            keepalive_timeout=75,
+                            enable_cleanup_closed=True,
+                        ),
+                        timeout=aiohttp.ClientTimeout(total=5, connect=2),
+                    )
+        return self._session
+
+    async def warm_up(self) -> None:
+        """Open the keepalive connection (DNS + TCP + TLS) before the first weather request"""
+        if not self.weather_api_key:
+            return
+        try:
+            session = await self._get_session()
+            async with session.head(_OWM_BASE.origin()):
+                pass
+        except Exception as e:
+            logger.debug(f"Weather API warm-up failed: {e}")
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def get_weather(self, city: str = "San Ramon", state: str = "CA") -> str:
         """Get current weather for the specified city and state"""
         if not self.weather_api_key:
-            return "I'm sorry, I don't have access to live weather data right now, but San Ramon typically enjoys a Mediterranean climate with warm, dry summers and mild winters!"
+            return _FALLBACK_NO_KEY
         
+        key = (city.lower(), state.lower())
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached.fetched_at < self._cache_ttl:
+            return cached.report
+
+        # The fetch runs as its own task so a cancelled caller never fails the others waiting on it
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_weather(city, state, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_weather(self, city: str, state: str, key: tuple[str, str]) -> str:
+        """Fetch and format the current weather from OpenWeather behind the circuit breaker"""
+        cached = self._cache.get(key)
+        # After the cooldown the breaker is half-open: one trial request decides whether it closes
+        half_open = self._consec_failures >= _BREAKER_THRESHOLD
+        if time.monotonic() < self._open_until or (half_open and self._probing):
+            # Circuit is open: skip the network and serve the last known report if we have one
+            return cached.report if cached is not None else _FALLBACK_EXC
+
+        if not half_open:
+            return await self._fetch_with_retries(city, state, key, cached, _MAX_ATTEMPTS)
+        self._probing = True
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"http://api.openweathermap.org/data/2.5/weather?q={city},{state},US&appid={self.weather_api_key}&units=imperial"
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
+            return await self._fetch_with_retries(city, state, key, cached, 1)
+        finally:
+            self._probing = False
+
+    async def _fetch_with_retries(self, city: str, state: str, key: tuple[str, str],
+                                  cached: _CacheEntry | None, attempts: int) -> str:
+        """Request the weather, retrying transient failures within the overall time budget"""
+        url = _OWM_BASE.with_query(q=f"{city},{state},US", appid=self.weather_api_key, units="imperial")
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        fallback = _FALLBACK_EXC
+        deadline = time.monotonic() + _RETRY_BUDGET
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, _RETRY_BASE_DELAY * 2 ** attempt))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                session = await self._get_session()
+                timeout = aiohttp.ClientTimeout(total=remaining)
+                async with session.get(url, headers=headers, timeout=timeout) as response:
+                    if response.status == 304 and cached is not None:
+                        self._consec_failures = 0
+                        self._cache[key] = cached._replace(fetched_at=time.monotonic())
+                        return cached.report
+                    elif response.status == 200:
+                        data = orjson.loads(await response.read())
                         
-                        temp = data['main']['temp']
-                        feels_like = data['main']['feels_like']
-                        humidity = data['main']['humidity']
+                        main = data['main']
+                        temp, feels_like, humidity = main['temp'], main['feels_like'], main['humidity']
                         description = data['weather'][0]['description']
                         wind_speed = data['wind']['speed']
                         
-                        weather_report = f"""
-                        Here's the current weather in {city}, {state}:
-                        
-                        🌡️ Temperature: {temp}°F (feels like {feels_like}°F)
-                        🌤️ Conditions: {description.title()}
-                        💧 Humidity: {humidity}%
-                        💨 Wind Speed: {wind_speed} mph
-                        
-                        As someone who's lived in San Ramon for years, I can tell you this is pretty typical for our area! 
-                        We're blessed with great weather year-round here in the East Bay.
-                        """
-                        
-                        return weather_report.strip()
-                    else:
-                        return "I'm having trouble accessing the weather data right now, but San Ramon usually has beautiful weather!"
-        except Exception as e:
-            logger.error(f"Weather API error: {e}")
-            return "I'm having trouble getting the latest weather data, but San Ramon typically has wonderful Mediterranean weather!"
+                        weather_report = _WEATHER_TPL.format_map({
+                            'city': city,
+                            'state': state,
+                            'temp': temp,
+                            'feels_like': feels_like,
+                            'desc': description.title(),
+                            'humidity': humidity,
+                            'wind': wind_speed,
+                        })
+                        self._consec_failures = 0
+                        self._cache[key] = _CacheEntry(
+                            time.monotonic(),
+                            weather_report,
+                            response.headers.get('ETag'),
+                            response.headers.get('Last-Modified'),
+                        )
+                        return weather_report
+                    elif response.status != 429 and response.status < 500:
+                        # Client errors (e.g. unknown city) won't succeed on retry and aren't an outage
+                        self._consec_failures = 0
+                        return _FALLBACK_HTTP_ERR
+                    logger.warning(f"Weather API returned {response.status} (attempt {attempt + 1})")
+                    fallback = _FALLBACK_HTTP_ERR
+            except Exception as e:
+                logger.error(f"Weather API error: {e!r}")
+                fallback = _FALLBACK_EXC
+
+        self._record_failure()
+        return cached.report if cached is not None else fallback
+
+    def _record_failure(self) -> None:
+        """Count a failed fetch and open the circuit after too many in a row"""
+        self._consec_failures += 1
+        # The count is kept once the breaker trips, so a failed half-open trial re-opens it at once
+        if self._consec_failures >= _BREAKER_THRESHOLD:
+            self._open_until = time.monotonic() + _BREAKER_COOLDOWN
+            logger.warning(f"Weather API circuit open for {_BREAKER_COOLDOWN}s after repeated failures")
 
 class WeatherAgent(agents.Agent):
     def __init__(self) -> None:
@@ -91,21 +248,53 @@ class WeatherAgent(agents.Agent):
             tools=[]  # Will be set after function tool is created
         )
 
-async def entrypoint(ctx: JobContext):
-    # Check required API keys
-    required_keys = {
-        "DEEPGRAM_API_KEY": os.getenv("DEEPGRAM_API_KEY"),
-        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY"),
-        "OPENWEATHER_API_KEY": os.getenv("OPENWEATHER_API_KEY"),
-        "LIVEKIT_URL": os.getenv("LIVEKIT_URL"),
-    }
-    missing_keys = [k for k, v in required_keys.items() if not v]
+# LIVEKIT_URL may also come from --url, so livekit's CLI validates it rather than this check
+_REQUIRED_KEYS = frozenset({"DEEPGRAM_API_KEY", "OPENAI_API_KEY", "OPENWEATHER_API_KEY"})
+# CLI commands that run jobs; download-files and --help need no API keys
+_SERVING_COMMANDS = frozenset({"start", "dev", "connect", "console"})
+
+def check_required_keys() -> None:
+    """Exit at worker boot if required API keys are missing, instead of failing every job"""
+    missing_keys = sorted(k for k in _REQUIRED_KEYS if not os.getenv(k))
     if missing_keys:
         logger.error(f"Missing API keys: {', '.join(missing_keys)}. Set them in .env and restart.")
-        return
+        raise SystemExit(1)
 
+# Speech plugins and the Silero VAD model, loaded once per worker process and shared by all sessions
+_PLUGINS = None
+_SHARED_VAD = None
+
+def _load_plugins():
+    """Import the speech plugins; livekit registers them on import, which must happen on the main thread.
+
+    Called from __main__ before run_app, so thread executors (console mode, the Windows default)
+    find the plugins already loaded. Process executors' children don't run __main__ and import
+    them here from prewarm, on their own main thread.
+    """
+    global _PLUGINS
+    if _PLUGINS is None:
+        from livekit.plugins import deepgram, openai, silero
+        _PLUGINS = (deepgram, openai, silero)
+    return _PLUGINS
+
+def prewarm(proc: agents.JobProcess):
+    """Import the plugins and load the VAD model during worker warmup, before any job is assigned"""
+    global _SHARED_VAD
+    _, _, silero = _load_plugins()
+    _SHARED_VAD = silero.VAD.load()
+
+async def entrypoint(ctx: JobContext):
     # Remove the initial_ctx setup since we're putting instructions in the Agent class
     weather_agent_instance = WeatherAgentClass()
+    # Establish the OpenWeather connection while the room connects and the agent greets the user
+    warm_up_task = asyncio.create_task(weather_agent_instance.warm_up())
+
+    async def close_weather_client():
+        # Stop a still-running warm-up before its session is closed underneath it
+        warm_up_task.cancel()
+        await weather_agent_instance.aclose()
+
+    ctx.add_shutdown_callback(close_weather_client)
     
     # Create the weather function tool
     @agents.llm.function_tool(
@@ -119,10 +308,13 @@ async def entrypoint(ctx: JobContext):
         """Get the current weather conditions for a specified city and state"""
         return await weather_agent_instance.get_weather(city, state)
 
+    # Plugins were imported on the process's main thread, by __main__ or prewarm
+    deepgram, openai, _ = _PLUGINS
+
     # Create and start the session with STT, VAD, LLM, TTS
     session = AgentSession(
         stt=deepgram.STT(),
-        vad=silero.VAD.load(),
+        vad=_SHARED_VAD,
         llm=openai.LLM(model="gpt-4o-mini", temperature=0.7),
         tts=openai.TTS(voice="nova"),
     )
@@ -164,4 +356,9 @@ async def entrypoint(ctx: JobContext):
     await session.generate_reply(instructions=welcome_text)  # This triggers TTS and on_response_chunk for transcript
 
 if __name__ == "__main__":
-    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint))
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in _SERVING_COMMANDS:
+        check_required_keys()
+    # Register the plugins on the main thread before any executor thread can need them
+    _load_plugins()
+    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))